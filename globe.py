@@ -1,22 +1,22 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import os
-from phi.agent import Agent
-import io
-from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
-from reportlab.lib.units import inch
-import markdown
-import html2text
-from bs4 import BeautifulSoup
-from phi.model.groq import Groq
-from phi.tools.exa import ExaTools
-from phi.tools.duckduckgo import DuckDuckGo
-from phi.assistant import Assistant
-import base64
+import mistune
+import threading
+import json
 import re
-from datetime import datetime
+import string
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import numpy as np
+import functools
+import importlib.util
+from collections import deque
+from itertools import islice
+from dataclasses import dataclass
+from typing import Optional
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator, model_validator
+from datetime import datetime, date, timedelta
 import inspect  # Import inspect for modification
 
 # Monkey patch inspect.getargspec with inspect.getfullargspec
@@ -36,249 +36,471 @@ inspect.getargspec = getargspec_patch
 exa_api_key = os.environ.get("EXA_API_KEY")
 groq_api_key = os.environ.get("GROQ_API_KEY")
 
+# Searches are network-bound, so this many run at once inside a single tool call
+RESEARCH_WORKERS = 6
+
+def _call_isolated(call):
+    # A search that raises (DuckDuckGo does on a rate limit) yields an error object in its
+    # place, so the other searches' results are still returned
+    try:
+        return call()
+    except Exception as e:
+        return {"error": str(e)}
+
+def run_parallel(calls):
+    """Run zero-argument callables concurrently and return their results, or error objects, in order"""
+    with ThreadPoolExecutor(max_workers=RESEARCH_WORKERS) as executor:
+        return list(executor.map(_call_isolated, calls))
+
+# Date spellings the model commonly uses in tool calls, besides ISO 8601
+_TOOL_DATE_FORMATS = ("%b %d, %Y", "%B %d, %Y", "%d %b %Y", "%d %B %Y", "%d/%m/%Y")
+
+class TripResearchArgs(BaseModel):
+    """Validated trip research arguments, checked before any search is sent"""
+    model_config = ConfigDict(str_strip_whitespace=True)
+
+    origin: str = ""
+    destination: str = Field(min_length=2)
+    start_date: date
+    end_date: date
+
+    @field_validator("start_date", "end_date", mode="before")
+    @classmethod
+    def _parse_date(cls, value):
+        # Accept the date spellings used in our own prompts; anything else is left to pydantic
+        if isinstance(value, str):
+            for fmt in _TOOL_DATE_FORMATS:
+                try:
+                    return datetime.strptime(value.strip(), fmt).date()
+                except ValueError:
+                    continue
+        return value
+
+    @model_validator(mode="after")
+    def _check_date_order(self):
+        if self.end_date < self.start_date:
+            raise ValueError("end_date must not be before start_date")
+        return self
+
+def make_trip_researcher(exa_tools, duckduckgo):
+    """Build the trip research function on top of the given search toolkits"""
+    def research_trip(origin, destination, start_date, end_date):
+        """Search concurrently for flights, accommodation, attractions and local transportation.
+
+        Returns a topic -> search results dict, where a failed search gives an "error" object.
+        Raises ValidationError for arguments no search could use.
+        """
+        args = TripResearchArgs(origin=origin, destination=destination, start_date=start_date, end_date=end_date)
+        dates = f"{args.start_date:%Y-%m-%d} to {args.end_date:%Y-%m-%d}"
+        departure = f" from {args.origin}" if args.origin else ""
+        flight_query = f"flights{departure} to {args.destination} {dates} airlines prices schedules"
+        searches = {
+            # Exa is preferred for flight data when it is configured
+            "flights": (lambda: exa_tools.search_exa(flight_query)) if exa_tools
+                       else (lambda: duckduckgo.duckduckgo_search(flight_query)),
+            "accommodation": lambda: duckduckgo.duckduckgo_search(f"best hotels in {args.destination} prices per night"),
+            "attractions": lambda: duckduckgo.duckduckgo_search(f"top things to do in {args.destination}"),
+            "local_transportation": lambda: duckduckgo.duckduckgo_search(f"getting around {args.destination} local transportation"),
+        }
+        return dict(zip(searches, run_parallel(searches.values())))
+    return research_trip
+
+# The search toolkits hold no per-run state, so one set is shared by every session
+@st.cache_resource(show_spinner=False)
+def create_search_toolkits():
+    """The Exa toolkit (None without an API key) and the DuckDuckGo toolkit"""
+    # phi's toolkits are imported on first use, and only those that will be used
+    from phi.tools.duckduckgo import DuckDuckGo
+    exa_tools = None
+    if exa_api_key:
+        from phi.tools.exa import ExaTools
+        exa_tools = ExaTools(api_key=exa_api_key)
+    # DuckDuckGo is always available as it doesn't require an API key
+    return exa_tools, DuckDuckGo()
+
 # Define tools list for the Agent - simplified to only use Exa and DuckDuckGo
 def create_tools_list():
-    tools = []
-    # Add Exa if API key is available
-    if exa_api_key:
-        tools.append(ExaTools(api_key=exa_api_key))
-    # Always add DuckDuckGo as it doesn't require an API key
-    tools.append(DuckDuckGo())
-    return tools
+    return [toolkit for toolkit in create_search_toolkits() if toolkit is not None]
 
-# Create the agents with error handling for API keys
-if groq_api_key:
+# One research pass per plan fans out the usual searches, instead of each section agent
+# spending tool-calling rounds on them
+@st.cache_resource(show_spinner=False)
+def get_trip_researcher():
+    return make_trip_researcher(*create_search_toolkits())
+
+# Upper bound in seconds on any single Groq request (or gap between streamed chunks), so a
+# stalled connection fails with an error instead of blocking the session indefinitely
+GROQ_TIMEOUT = 60
+
+# phi creates a new Groq SDK client for every request unless one is supplied, so share
+# one client (and its keep-alive connection pool) across sessions and reruns
+@st.cache_resource(show_spinner=False)
+def get_groq_client():
+    from groq import Groq as GroqClient
+    return GroqClient(api_key=groq_api_key, timeout=GROQ_TIMEOUT)
+
+def create_agents():
+    """Build the itinerary planner and chat agents"""
+    # Deferred so a page load without a Groq key never imports phi's agent stack
+    from phi.agent import Agent
+    from phi.model.groq import Groq
+    from phi.tools.duckduckgo import DuckDuckGo
     globe_hopper_agent = Agent(
         name="Globe Hopper",
-        model=Groq(id="deepseek-r1-distill-llama-70b", api_key=groq_api_key),
+        model=Groq(id="deepseek-r1-distill-llama-70b", api_key=groq_api_key, timeout=GROQ_TIMEOUT),
         tools=create_tools_list(),
         markdown=True,
         description="You are an expert itinerary planning agent. Your role is to assist users in creating detailed, customized travel plans tailored to their preferences and needs.",
         instructions=[
+            "When search results are included with a request, build on them and use the tools only for anything they do not cover.",
             "Use Exa to search and extract relevant data from reputable travel platforms including flight information, schedules, and prices.",
             "Use DuckDuckGo to find up-to-date information about destinations.",
             "Use Exa to search for information about airports, flights, and transportation options.",
-            "Collect information on flights, accommodations, local attractions, and estimated costs from these sources.",
+            "Collect the information the request asks for from these sources.",
             "Ensure that the gathered data is accurate and tailored to the user's preferences, such as destination, group size, and budget constraints.",
-            "Create a clear and concise itinerary that includes: detailed day-by-day travel plan, suggested transportation and accommodation options, activity recommendations (e.g., sightseeing, dining, events), an estimated cost breakdown (covering transportation, accommodation, food, and activities).",
-            "Present flight options with prices, departure/arrival times, and airlines when available based on Exa search results.",
+            "Each request covers one part of the itinerary, and the other parts are written separately; cover only that part, clearly and concisely.",
+            "When covering flights, present options with prices, departure/arrival times, and airlines when available based on Exa search results.",
             "If a particular website or travel option is unavailable, provide alternatives from other trusted sources.",
             "Use INR for all price calculations and mentions.",
         ],
     )
     chat_agent = Agent(
         name="Chat Bot",
-        model=Groq(id="llama-3.3-70b-versatile", api_key=groq_api_key),
+        model=Groq(id="llama-3.3-70b-versatile", api_key=groq_api_key, client=get_groq_client()),
         tools=[DuckDuckGo()],
         markdown=True,
     )
+    return globe_hopper_agent, chat_agent
+
+# Create the agents with error handling for API keys. Agents keep per-run state, so
+# rather than sharing them between users each session builds its pair once and reuses
+# it on every rerun.
+if groq_api_key:
+    from groq import APITimeoutError
+    if "agents" not in st.session_state:
+        st.session_state.agents = create_agents()
+    globe_hopper_agent, chat_agent = st.session_state.agents
 else:
     globe_hopper_agent = None
     chat_agent = None
 
-def get_pdf_download_link(markdown_text, filename, destination, travel_dates):
-    """Generate a download link for a PDF version of the itinerary"""
-    # Create a PDF in memory
-    buffer = io.BytesIO()
-    # Set up the PDF document
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    elements = []
-    # Set up styles
-    styles = getSampleStyleSheet()
-    title_style = styles['Title']
-    heading_style = styles['Heading1']
-    subheading_style = styles['Heading2']
-    normal_style = styles['Normal']
-    # Custom styles
-    section_style = ParagraphStyle(
-        'SectionStyle',
-        parent=styles['Heading2'],
-        textColor=colors.blue,
-        spaceAfter=12
-    )
-    day_style = ParagraphStyle(
-        'DayStyle',
-        parent=styles['Heading3'],
-        textColor=colors.navy,
-        backColor=colors.lightgrey,
-        borderPadding=5,
-        spaceAfter=10
-    )
-    bullet_style = ParagraphStyle(
-        'BulletStyle',
-        parent=styles['Normal'],
-        leftIndent=20,
-        spaceAfter=5
+# Independent parts of a travel plan, each with the research topics it builds on; each is
+# written by its own agent run and the answers are stitched together in this order. Tabular
+# facts are asked for as markdown tables, which take fewer output tokens than prose and render
+# the same way every time
+PLAN_SECTIONS = [
+    ("Flights & Transportation", ("flights", "local_transportation"), "Cover only flight options and local transportation. Use Exa to search for flight information, prices, and schedules. List flights as a markdown table with Airline, Departure, Arrival and Price (INR) columns, then local transportation as short bullet points."),
+    ("Accommodation", ("accommodation",), "Cover only accommodation options, as a markdown table with Name, Type, Area and Price per Night (INR) columns."),
+    ("Day-by-Day Itinerary", ("attractions", "local_transportation"), "Cover only the detailed day-by-day travel plan with sightseeing, dining and event recommendations, with a ### heading per day and short bullet points under it."),
+    ("Estimated Costs", ("flights", "accommodation", "attractions", "local_transportation"), "Cover only the estimated cost breakdown, as a markdown table with Category, Details and Cost (INR) columns for transportation, accommodation, food and activities, ending with a Total row."),
+]
+
+def _run_plan_section(agent, prompt, title, placeholder, ctx):
+    # phi runs tool calls synchronously inside a model turn, so each section runs on its own
+    # worker thread; attaching the script's run context lets the thread write to its placeholder
+    add_script_run_ctx(threading.current_thread(), ctx)
+    if placeholder is None:
+        response = agent.run(prompt)
+        return str(response.content)
+    # Stream the section into its placeholder as tokens arrive
+    chunks = []
+    for chunk in agent.run(prompt, stream=True):
+        if chunk.content:
+            chunks.append(chunk.content)
+            placeholder.markdown(f"## {title}\n\n{''.join(chunks)}")
+    return "".join(chunks)
+
+def _section_agent(agent):
+    # Each section runs on its own copy of the agent, since a single Agent keeps per-run state;
+    # the copies share the process-wide Groq client
+    section_agent = agent.deep_copy()
+    section_agent.model.client = get_groq_client()
+    return section_agent
+
+def _section_prompt(trip_query, instructions, topics, research):
+    prompt = f"{trip_query}. {instructions} Use INR for all prices. Do not add an introduction or closing remarks."
+    section_research = {topic: research[topic] for topic in topics if topic in research}
+    if section_research:
+        prompt += f"\n\nSearch results already gathered for this trip, in JSON:\n{json.dumps(section_research)}"
+    return prompt
+
+def generate_travel_plan(agent, trip_query, origin, destination, start_date, end_date, placeholders=None):
+    """Research the trip once, write all plan sections concurrently and return the combined
+    markdown itinerary.
+
+    When one st.empty() placeholder per PLAN_SECTIONS entry is given, each section is
+    streamed into its placeholder while it is generated.
+    """
+    if placeholders is None:
+        placeholders = [None] * len(PLAN_SECTIONS)
+    # The shared searches run once for the whole plan, and each section gets the topics it needs;
+    # if the trip details can't be searched, the sections fall back to their own tools
+    try:
+        research = get_trip_researcher()(origin, destination, start_date, end_date)
+    except ValidationError:
+        research = {}
+    ctx = get_script_run_ctx()
+    # Model turns and tool calls are blocking network I/O, so one thread per section overlaps
+    # them all, including each section's tool rounds
+    with ThreadPoolExecutor(max_workers=len(PLAN_SECTIONS)) as executor:
+        futures = [
+            executor.submit(
+                _run_plan_section,
+                _section_agent(agent),
+                _section_prompt(trip_query, instructions, topics, research),
+                title,
+                placeholder,
+                ctx,
+            )
+            for (title, topics, instructions), placeholder in zip(PLAN_SECTIONS, placeholders)
+        ]
+        responses = [future.result() for future in futures]
+    return "\n\n".join(
+        f"## {title}\n\n{response}" for (title, _, _), response in zip(PLAN_SECTIONS, responses)
     )
-    # Add a header
-    elements.append(Paragraph(f"Travel Itinerary to {destination}", title_style))
-    elements.append(Spacer(1, 0.2*inch))
-    elements.append(Paragraph(f"Travel Dates: {travel_dates}", subheading_style))
-    elements.append(Spacer(1, 0.3*inch))
-    # Convert markdown to HTML
-    html_content = markdown.markdown(markdown_text)
-    # Parse HTML with BeautifulSoup
-    soup = BeautifulSoup(html_content, 'html.parser')
-    # Process the HTML content into reportlab elements
-    current_section = None
-    for element in soup.find_all(['h1', 'h2', 'h3', 'p', 'ul', 'li']):
-        if element.name == 'h1':
-            elements.append(Paragraph(element.text, heading_style))
-            elements.append(Spacer(1, 0.1*inch))
-        elif element.name == 'h2':
-            elements.append(Paragraph(element.text, section_style))
-            elements.append(Spacer(1, 0.1*inch))
-        elif element.name == 'h3':
-            elements.append(Paragraph(element.text, day_style))
-        elif element.name == 'p':
-            elements.append(Paragraph(element.text, normal_style))
-            elements.append(Spacer(1, 0.05*inch))
-        elif element.name == 'ul':
-            # Skip the ul tag itself, we'll process the li tags
-            pass
-        elif element.name == 'li':
-            elements.append(Paragraph(f"• {element.text}", bullet_style))
-    # If no elements were created from the HTML parsing, add raw text as paragraphs
-    if len(elements) <= 4:  # Only header elements present
-        # Split by lines and add as paragraphs
-        for line in markdown_text.split('\n'):
-            if line.strip():
-                elements.append(Paragraph(line, normal_style))
-                elements.append(Spacer(1, 0.05*inch))
-    # Add a footer
-    elements.append(Spacer(1, 0.5*inch))
-    elements.append(Paragraph("Generated by GlobeTrek - Your AI Travel Companion", 
-                             ParagraphStyle('Footer', alignment=1, textColor=colors.grey)))
-    # Build the PDF
-    doc.build(elements)
-    # Get the PDF data and encode it
-    pdf_data = buffer.getvalue()
-    buffer.close()
-    b64 = base64.b64encode(pdf_data).decode()
-    # Create download link
-    href = f'<a href="data:application/pdf;base64,{b64}" download="{filename}" class="download-button">Download PDF Itinerary</a>'
-    return href
-
-# Define CSS for better UI with download button styles
-def set_custom_styles():
-    st.markdown("""
-    <style>
-    .stButton button {
-        background-color: #4a86e8;
-        color: white;
-        font-weight: bold;
-        border-radius: 5px;
-        padding: 0.5rem 1rem;
-        width: 100%;
-    }
-    .stButton button:hover {
-        background-color: #3a76d8;
-    }
-    .card {
-        border-radius: 10px;
-        padding: 20px;
-        box-shadow: 0 4px 8px rgba(0,0,0,0.1);
-        margin-bottom: 20px;
-    }
-    .trip-header {
-        border-left: 5px solid #4a86e8;
-        padding: 15px;
-        margin-bottom: 20px;
-        border-radius: 5px;
-    }
-    .section-title {
-        color: #4a86e8;
-        font-weight: bold;
-        margin-bottom: 10px;
-    }
-    .itinerary-container {
-        border-radius: 8px;
-        border: 1px solid #e0e0e0;
-        margin-bottom: 20px;
-        overflow: hidden;
-    }
-    .itinerary-header {
-        background-color: #4a86e8;
-        color: white;
-        padding: 15px;
-        font-size: 18px;
-        font-weight: bold;
-    }
-    .itinerary-content {
-        padding: 20px;
-    }
-    .day-card {
-        background-color: #f9f9f9;
-        border-radius: 8px;
-        padding: 15px;
-        margin-bottom: 15px;
-        border-left: 4px solid #4a86e8;
-    }
-    .day-title {
-        font-weight: bold;
-        color: #4a86e8;
-        margin-bottom: 10px;    
-        border-bottom: 1px solid #e0e0e0;
-        padding-bottom: 5px;
-    }
-    .activity-item {
-        margin-bottom: 8px;
-        padding-left: 10px;
-    }
-    .flight-card {
-        border-radius: 8px;
-        padding: 15px;
-        margin-bottom: 15px;
-        border: 1px solid #d0e1f9;
-    }
-    .accommodation-card {
-        border-radius: 8px;
-        padding: 15px;
-        margin-bottom: 15px;
-        border: 1px solid #d0f9e0;
-    }
-    .cost-card {
-        border-radius: 8px;
-        padding: 15px;
-        margin-bottom: 15px;
-        border: 1px solid #f9e0d0;
-    }
-    .highlight-text {
-        color: #4a86e8;
-        font-weight: bold;
-    }
-    .download-button {
-        display: inline-block;
-        background-color: #28a745;
-        color: white;
-        text-decoration: none;
-        padding: 10px 20px;
-        border-radius: 5px;
-        font-weight: bold;
-        margin-top: 10px;
-        text-align: center;
-        transition: background-color 0.3s;
-    }
-    .download-button:hover {
-        background-color: #218838;
-        color: white;
-    }
-    .download-section {
-        margin-top: 15px;
-        text-align: center;
-    }
-    </style>
-    """, unsafe_allow_html=True)
 
-# Set up Streamlit UI
-st.set_page_config(layout="wide", page_title="GlobeTrek - Your AI Travel Companion", page_icon="✈️")
-set_custom_styles()
-st.markdown("""
+# Generated plans shared by all sessions: identical prompts within the TTL reuse the itinerary
+PLAN_CACHE_TTL = timedelta(hours=1)
+PLAN_CACHE_MAX_ENTRIES = 64
+
+@st.cache_resource(show_spinner=False)
+def get_shared_plan_cache():
+    """Process-wide prompt -> (created_at, itinerary) cache of generated plans"""
+    return {}
+
+# Every session's script thread reads and writes the shared cache. The script re-executes
+# this module on every rerun, so the lock is cached alongside the dict rather than rebuilt
+@st.cache_resource(show_spinner=False)
+def get_shared_plan_cache_lock():
+    return threading.Lock()
+
+def get_shared_plan(prompt):
+    """Return the itinerary generated for this exact prompt within the TTL, or None"""
+    with get_shared_plan_cache_lock():
+        entry = get_shared_plan_cache().get(prompt)
+    if entry is None or datetime.now() - entry[0] > PLAN_CACHE_TTL:
+        return None
+    return entry[1]
+
+def store_shared_plan(prompt, response):
+    cache = get_shared_plan_cache()
+    with get_shared_plan_cache_lock():
+        cache.pop(prompt, None)
+        cache[prompt] = (datetime.now(), response)
+        # Evict the oldest entries; dicts keep insertion order
+        while len(cache) > PLAN_CACHE_MAX_ENTRIES:
+            cache.pop(next(iter(cache)), None)
+
+# Minimum cosine similarity for a past prompt to count as the same request. Plans need a
+# closer match than chat, since a small wording change there can change the itinerary.
+CHAT_SEMANTIC_THRESHOLD = 0.92
+PLAN_SEMANTIC_THRESHOLD = 0.95
+# Rows preallocated for a scope's embedding matrix when its first response is stored
+_SEMANTIC_CACHE_INITIAL_ROWS = 16
+
+@st.cache_resource(show_spinner=False)
+def get_embedder():
+    """Load the optional sentence embedding model once per server process, or None without it"""
+    # sentence-transformers pulls in torch, so it is only imported the first time a cache
+    # lookup needs it rather than on every page load
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        return None
+    return SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+
+@functools.lru_cache(maxsize=32)
+def _embed(prompt):
+    return get_embedder().encode(prompt, normalize_embeddings=True).astype(np.float32)
+
+def new_response_cache():
+    """An empty two-level response cache: exact prompt keys plus per-scope embedding matrices"""
+    return {"exact": {}, "semantic": {}}
+
+def _response_cache_key(scope, prompt):
+    normalized = " ".join(prompt.lower().split())
+    return hashlib.blake2b(f"{scope}|temperature=default|{normalized}".encode(), digest_size=16).hexdigest()
+
+def get_cached_response(cache, scope, prompt, threshold, match_text=None):
+    """Return a stored response for an identical or near-identical prompt in the same scope, or None.
+
+    match_text, when given, is what the similarity tier compares instead of the whole prompt,
+    for scopes that already pin down everything else the prompt says.
+    """
+    response = cache["exact"].get(_response_cache_key(scope, prompt))
+    if response is not None or get_embedder() is None:
+        return response
+    entries = cache["semantic"].get(scope)
+    if entries is None:
+        return None
+    # Embeddings are unit length, so one matrix-vector product over the filled rows gives
+    # every cosine similarity
+    scores = entries["embeddings"][:entries["count"]] @ _embed(prompt if match_text is None else match_text)
+    best = int(np.argmax(scores))
+    return entries["responses"][best] if scores[best] >= threshold else None
+
+def store_cached_response(cache, scope, prompt, response, match_text=None):
+    """Remember a response under its exact prompt key and, when available, the embedding of
+    match_text (the prompt by default)"""
+    cache["exact"][_response_cache_key(scope, prompt)] = response
+    if get_embedder() is None:
+        return
+    embedding = _embed(prompt if match_text is None else match_text)
+    entries = cache["semantic"].get(scope)
+    if entries is None:
+        entries = cache["semantic"][scope] = {
+            "embeddings": np.empty((_SEMANTIC_CACHE_INITIAL_ROWS, embedding.shape[0]), dtype=np.float32),
+            "count": 0,
+            "responses": [],
+        }
+    # Embeddings live in one contiguous (rows, dim) float32 buffer that doubles when full,
+    # so adding an entry doesn't copy the whole matrix
+    if entries["count"] == entries["embeddings"].shape[0]:
+        grown = np.empty((2 * entries["count"], embedding.shape[0]), dtype=np.float32)
+        grown[:entries["count"]] = entries["embeddings"]
+        entries["embeddings"] = grown
+    entries["embeddings"][entries["count"]] = embedding
+    entries["count"] += 1
+    entries["responses"].append(response)
+
+# Budget choices on the travel form and how each is phrased in the prompt
+_BUDGET_MAP = {
+    "Budget - Up to ₹50,000": "under ₹50,000",
+    "Mid-range - ₹50,000 to ₹1,50,000": "₹50,000-1,50,000",
+    "Luxury - Above ₹1,50,000": "over ₹1,50,000"
+}
+
+def _clean_text(text):
+    """Collapse runs of whitespace in a free-text form field and trim its ends"""
+    return " ".join(text.split())
+
+# Construct the full query from the travel form inputs; the widget values are passed in
+# explicitly so reruns with unchanged inputs are served from the cache. Free text is
+# whitespace-normalized and interests are sorted, so the same trip always produces the same
+# prompt and hits the plan caches however it was typed or clicked
+@st.cache_data(show_spinner=False)
+def construct_query(destination, origin_city, travel_dates, travelers,
+                    budget_option, interests, accommodation, additional_notes):
+    destination, origin_city, additional_notes = map(_clean_text, (destination, origin_city, additional_notes))
+    if not destination:
+        return ""
+    # Extract the budget range from the selection
+    budget_str = _BUDGET_MAP.get(budget_option, "flexible")
+    # Build the query from its parts and join once
+    parts = [f"Plan a trip to {destination} for {travelers} travelers"]
+    if origin_city:
+        parts.append(f" departing from {origin_city}")
+    parts.append(f" from {travel_dates} with a {budget_str} budget in INR")
+    if interests:
+        parts.append(f". We're interested in: {', '.join(sorted(interests))}")
+    if accommodation != "Any":
+        parts.append(f". We prefer staying in {accommodation}")
+    if additional_notes:
+        parts.append(f". Additional notes: {additional_notes}")
+    return "".join(parts)
+
+# A session keeps its most recent plans, and renders only the newest few of them by default
+MAX_SAVED_PLANS = 20
+RECENT_PLANS_SHOWN = 5
+
+@dataclass
+class TravelPlan:
+    """A submitted trip prompt, the itinerary generated for it and, once built, its HTML and PDF"""
+    query: str
+    response: str
+    html: Optional[str] = None
+    pdf: Optional[bytes] = None
+
+# Trips starting sooner than this depend on live availability and prices, so their plans aren't reused
+_PLAN_CACHE_MIN_LEAD_TIME = timedelta(days=7)
+
+def _should_cache(start_date):
+    """Whether a plan for a trip starting on start_date may be reused for the same prompt"""
+    return start_date - date.today() >= _PLAN_CACHE_MIN_LEAD_TIME
+
+# Markdown renderer for itineraries shown on screen; raw HTML from the model is escaped
+_itinerary_md = mistune.create_markdown(escape=True, plugins=['strikethrough', 'table'])
+
+# Itinerary card around the rendered plan, parsed once. Its lines start at column 0 so the
+# markdown renderer treats it as an HTML block rather than an indented code block
+_ITINERARY_CARD = string.Template("""<div class="itinerary-container">
+<div class="itinerary-header">🌟 Your Customized Travel Itinerary</div>
+<div class="itinerary-content">
+$content
+</div>
+</div>""")
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def render_itinerary_html(md_text):
+    """Render itinerary markdown to sanitized HTML inside our itinerary card, once, server-side"""
+    # mistune already escapes raw HTML from the model, so the content is safe to insert
+    return _ITINERARY_CARD.substitute(content=_itinerary_md(md_text))
+
+
+# Custom CSS for the UI, including download button styles. static/ is served by Streamlit
+# (see .streamlit/config.toml), so the browser fetches and caches the stylesheet once
+_CSS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "custom.css")
+_STYLESHEET_LINK = '<link rel="stylesheet" href="app/static/custom.css">'
+
+def _minify_css(css):
+    """Strip comments and insignificant whitespace from a stylesheet"""
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.DOTALL)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};:,>])\s*", r"\1", css)
+    return css.replace(";}", "}").strip()
+
+@st.cache_data(show_spinner=False)
+def _inline_styles():
+    """The stylesheet as one minified <style> block, for when static serving is off"""
+    with open(_CSS_PATH, encoding="utf-8") as f:
+        return f"<style>{_minify_css(f.read())}</style>"
+
+# Static page header and footer, emitted unchanged on every rerun
+_HEADER_HTML = """
 <div style="text-align: center">
     <h1 style="color: #4a86e8;">✈️ GlobeTrek</h1>
     <p style="font-size: 1.2em; margin-bottom:20px;">Your AI-powered travel planning assistant</p>
 </div>
-""", unsafe_allow_html=True)
+"""
+
+_FOOTER_HTML = """
+<div style="text-align: center; margin-top: 50px; padding: 20px; border-top: 1px solid #eee; color: #888;">
+    <p>Powered by AI - GlobeTrek Travel Planner © 2025</p>
+</div>
+"""
+
+@st.cache_resource(show_spinner=False)
+def _static_css_served():
+    """Whether the browser will accept app/static/custom.css as a stylesheet"""
+    # Only the starlette-based server serves app static files with their real content type;
+    # earlier servers send .css as text/plain with nosniff, so browsers drop the stylesheet
+    return (st.get_option("server.enableStaticServing")
+            and importlib.util.find_spec("streamlit.web.server.starlette") is not None)
+
+def set_custom_styles():
+    # Streamlit drops any element a rerun doesn't emit again, so this runs on every rerun;
+    # when the static route is usable it only re-sends the short link tag
+    if _static_css_served():
+        st.markdown(_STYLESHEET_LINK, unsafe_allow_html=True)
+    else:
+        st.markdown(_inline_styles(), unsafe_allow_html=True)
+
+def render_chat_history(messages):
+    """Show the chat messages with Streamlit's native chat elements"""
+    if not messages:
+        st.markdown("""
+        <div style="text-align: center; padding: 20px; color: #888;">
+            <p>No messages yet. Start chatting below!</p>
+        </div>
+        """, unsafe_allow_html=True)
+    for message in messages:
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
+
+# Set up Streamlit UI
+st.set_page_config(layout="wide", page_title="GlobeTrek - Your AI Travel Companion", page_icon="✈️")
+set_custom_styles()
+st.markdown(_HEADER_HTML, unsafe_allow_html=True)
 
 # Check for missing API keys and show warnings
 missing_keys = []
@@ -290,10 +512,14 @@ if missing_keys:
     st.warning(f"⚠️ The following environment variables are missing: {', '.join(missing_keys)}. Some features may not work properly.")
 
 # Initialize session state
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+if "plans" not in st.session_state:
+    st.session_state.plans = deque(maxlen=MAX_SAVED_PLANS)
 if "chat_messages" not in st.session_state:
     st.session_state.chat_messages = []
+if "_prompt_cache" not in st.session_state:
+    st.session_state["_prompt_cache"] = new_response_cache()
+if "_chat_cache" not in st.session_state:
+    st.session_state["_chat_cache"] = new_response_cache()
 
 # Create tabs with better styling
 travel_tab, chat_tab = st.tabs(["🧳 Plan Your Trip", "💬 Chat"])
@@ -304,93 +530,106 @@ with travel_tab:
         st.error("⚠️ GROQ API key is missing. Travel planning is unavailable.")
     else:
         st.markdown('<div class="trip-header"><h2>Create Your Dream Itinerary</h2><p>Fill in the details below to get a personalized travel plan</p></div>', unsafe_allow_html=True)
-        # Use columns for a cleaner layout
-        col1, col2 = st.columns(2)
-        with col1:
-            st.markdown('<div class="card">', unsafe_allow_html=True)
-            st.markdown('<div class="section-title">Basic Travel Details</div>', unsafe_allow_html=True)
-            origin_city = st.text_input("Departure City", 
-                                        placeholder="Where are you departing from?", 
-                                        help="City name you're departing from")
-            destination = st.text_input("Destination", 
-                                        placeholder="Where do you want to go?",
-                                        help="City, country or region you want to visit")
-            col1a, col1b = st.columns(2)
-            with col1a:
-                start_date = st.date_input("Departure Date")
-            with col1b:
-                end_date = st.date_input("Return Date")
-            travelers = st.number_input("Number of Travelers", min_value=1, value=2, step=1)
-            st.markdown('</div>', unsafe_allow_html=True)
-        with col2:
-            st.markdown('<div class="card">', unsafe_allow_html=True)
-            st.markdown('<div class="section-title">Travel Preferences</div>', unsafe_allow_html=True)
-            # Budget selection with radio buttons
-            budget_option = st.radio(
-                "Budget Range", 
-                ["Budget - Up to ₹50,000", "Mid-range - ₹50,000 to ₹1,50,000", "Luxury - Above ₹1,50,000"],
-                horizontal=True
-            )
-            # Travel interests as multi-select
-            interests = st.multiselect(
-                "Travel Interests",
-                ["Adventure", "Relaxation", "Cultural", "Food & Cuisine", "Shopping", "Nature", "Historical Sites", "Nightlife", "Family-friendly"],
-                default=["Adventure", "Cultural"]
-            )
-            # Accommodation preferences
-            accommodation = st.selectbox(
-                "Preferred Accommodation",
-                ["Budget Hostels", "Mid-range Hotels", "Luxury Resorts", "Homestays/Airbnb", "Any"]
-            )
-            additional_notes = st.text_area("Additional Requirements", 
-                                           placeholder="Any special needs or specific places you want to visit?")
-            st.markdown('</div>', unsafe_allow_html=True)
-        # Create plan button with better styling
-        plan_col1, plan_col2, plan_col3 = st.columns([1, 2, 1])
-        with plan_col2:
-            generate_plan = st.button("🚀 Generate My Travel Plan", use_container_width=True)
-        # Construct the full query with all the new inputs
-        def construct_query():
-            if not destination:
-                return ""
-            # Format the dates properly
-            travel_dates = f"{start_date.strftime('%b %d, %Y')} to {end_date.strftime('%b %d, %Y')}"
-            # Extract the budget range from the selection
-            budget_map = {
-                "Budget - Up to ₹50,000": "under ₹50,000",
-                "Mid-range - ₹50,000 to ₹1,50,000": "₹50,000-1,50,000",
-                "Luxury - Above ₹1,50,000": "over ₹1,50,000"
-            }
-            budget_str = budget_map.get(budget_option, "flexible")
-            # Build the query
-            query = f"Plan a trip to {destination} for {travelers} travelers"
-            if origin_city:
-                query += f" departing from {origin_city}"
-            query += f" from {travel_dates} with a {budget_str} budget in INR"
-            if interests:
-                query += f". We're interested in: {', '.join(interests)}"
-            if accommodation != "Any":
-                query += f". We prefer staying in {accommodation}"
-            if additional_notes:
-                query += f". Additional notes: {additional_notes}"
-            query += ". Please include flight options, accommodations, daily activities, and all costs in INR. Use Exa to search for flight information, prices, and schedules."
-            return query
+        # Collect all travel details in one form so editing a field doesn't rerun the app;
+        # the script only reruns when the plan is submitted
+        with st.form("travel_form"):
+            # Use columns for a cleaner layout
+            col1, col2 = st.columns(2)
+            with col1:
+                st.markdown('<div class="card">', unsafe_allow_html=True)
+                st.markdown('<div class="section-title">Basic Travel Details</div>', unsafe_allow_html=True)
+                origin_city = st.text_input("Departure City", 
+                                            placeholder="Where are you departing from?", 
+                                            help="City name you're departing from")
+                destination = st.text_input("Destination", 
+                                            placeholder="Where do you want to go?",
+                                            help="City, country or region you want to visit")
+                col1a, col1b = st.columns(2)
+                with col1a:
+                    start_date = st.date_input("Departure Date")
+                with col1b:
+                    end_date = st.date_input("Return Date")
+                travelers = st.number_input("Number of Travelers", min_value=1, value=2, step=1)
+                st.markdown('</div>', unsafe_allow_html=True)
+            with col2:
+                st.markdown('<div class="card">', unsafe_allow_html=True)
+                st.markdown('<div class="section-title">Travel Preferences</div>', unsafe_allow_html=True)
+                # Budget selection with radio buttons
+                budget_option = st.radio(
+                    "Budget Range", 
+                    list(_BUDGET_MAP),
+                    horizontal=True
+                )
+                # Travel interests as multi-select
+                interests = st.multiselect(
+                    "Travel Interests",
+                    ["Adventure", "Relaxation", "Cultural", "Food & Cuisine", "Shopping", "Nature", "Historical Sites", "Nightlife", "Family-friendly"],
+                    default=["Adventure", "Cultural"]
+                )
+                # Accommodation preferences
+                accommodation = st.selectbox(
+                    "Preferred Accommodation",
+                    ["Budget Hostels", "Mid-range Hotels", "Luxury Resorts", "Homestays/Airbnb", "Any"]
+                )
+                additional_notes = st.text_area("Additional Requirements", 
+                                               placeholder="Any special needs or specific places you want to visit?")
+                st.markdown('</div>', unsafe_allow_html=True)
+            # Create plan button with better styling
+            plan_col1, plan_col2, plan_col3 = st.columns([1, 2, 1])
+            with plan_col2:
+                generate_plan = st.form_submit_button("🚀 Generate My Travel Plan", use_container_width=True)
+        # Formatted once per rerun, for both the prompt and the PDF header
+        travel_dates = f"{start_date:%b %d, %Y} to {end_date:%b %d, %Y}"
         if generate_plan:
-            user_prompt = construct_query()
-            if destination and start_date and end_date:  # Basic validations
+            user_prompt = construct_query(destination, origin_city, travel_dates, travelers,
+                                          budget_option, tuple(interests), accommodation, additional_notes)
+            # The cleaned prompt is empty when the destination is blank or only whitespace
+            if user_prompt and start_date and end_date:  # Basic validations
                 with st.spinner("✨ Crafting your perfect itinerary..."):
-                    st.session_state.messages.append({"role": "user", "content": user_prompt})
                     try:
-                        response = globe_hopper_agent.run(user_prompt)
-                        # Ensure the content is a string
-                        response_content = str(response.content) if hasattr(response, 'content') else "No response generated."
-                        st.session_state.messages.append({"role": "assistant", "content": response_content})
+                        # An unchanged or near-identical prompt for the same trip reuses the earlier
+                        # plan, and with it the PDF built for it. Every structured form field is part
+                        # of the scope, so only the free-text notes are compared by similarity
+                        prompt_cache = st.session_state["_prompt_cache"]
+                        trip_scope = (
+                            globe_hopper_agent.model.id,
+                            _clean_text(destination).lower(),
+                            _clean_text(origin_city).lower(),
+                            start_date,
+                            end_date,
+                            travelers,
+                            budget_option,
+                            tuple(sorted(interests)),
+                            accommodation,
+                        )
+                        trip_notes = _clean_text(additional_notes)
+                        use_cache = _should_cache(start_date)
+                        plan = get_cached_response(prompt_cache, trip_scope, user_prompt, PLAN_SEMANTIC_THRESHOLD,
+                                                   trip_notes) if use_cache else None
+                        if plan is None:
+                            response_content = get_shared_plan(user_prompt) if use_cache else None
+                            if response_content is None:
+                                # Show each section as it streams in; the finished plan joins the history below
+                                section_placeholders = [st.empty() for _ in PLAN_SECTIONS]
+                                response_content = generate_travel_plan(globe_hopper_agent, user_prompt, _clean_text(origin_city),
+                                                                        _clean_text(destination), start_date, end_date,
+                                                                        section_placeholders)
+                                for placeholder in section_placeholders:
+                                    placeholder.empty()
+                                if use_cache:
+                                    store_shared_plan(user_prompt, response_content)
+                            plan = TravelPlan(user_prompt, response_content)
+                            if use_cache:
+                                store_cached_response(prompt_cache, trip_scope, user_prompt, plan, trip_notes)
+                        st.session_state.plans.append(plan)
+                    except APITimeoutError:
+                        st.error("⚠️ The travel planner took too long to respond. Please try again.")
                     except Exception as e:
                         st.error(f"Error fetching response: {str(e)}")
             else:
                 st.warning("Please fill in at least the destination and travel dates.")
         # Display travel plan history with improved visual components
-        if st.session_state.messages:
+        if st.session_state.plans:
             st.markdown("""
             <div style="margin-top: 40px;">
                 <h3 style="color: #4a86e8; border-bottom: 2px solid #4a86e8; padding-bottom: 10px;">
@@ -398,95 +637,89 @@ with travel_tab:
                 </h3>
             </div>
             """, unsafe_allow_html=True)
-            for i in range(0, len(st.session_state.messages), 2):
-                if i+1 < len(st.session_state.messages):  # Make sure we have both question and answer
-                    query = st.session_state.messages[i]["content"]
-                    response = st.session_state.messages[i+1]["content"]
-                    with st.expander(f"Travel Plan: {query[:50]}...", expanded=(i == len(st.session_state.messages)-2)):
-                        st.info(
+            # These are the same for every plan, so work them out once per rerun
+            destination_name = destination.replace(" ", "_") if destination else "travel_plan"
+            today_date = f"{datetime.now():%Y%m%d}"
+            filename = f"{destination_name}_itinerary_{today_date}.pdf"
+            # Only the most recent plans are rendered on every rerun; older ones stay out of
+            # the page until asked for
+            plan_count = len(st.session_state.plans)
+            newest_first = reversed(st.session_state.plans)
+            shown_plans = list(islice(newest_first, RECENT_PLANS_SHOWN))
+            plans_container = st.container()
+            older_count = plan_count - len(shown_plans)
+            if older_count and st.toggle(f"Show {older_count} older plan(s)", key="show_older_plans"):
+                shown_plans.extend(newest_first)
+            # Newest plan first, and expanded
+            for idx, plan in enumerate(shown_plans):
+                with plans_container.expander(f"Travel Plan: {plan.query[:50]}...", expanded=(idx == 0)):
+                    st.info(
     f"**You asked:**\n"
-    f"{query}"
+    f"{plan.query}"
 )
-                        # Process the Markdown response to add our custom CSS classes
-                        processed_response = response
-                        # Create a unique filename with destination and date
-                        destination_name = destination.replace(" ", "_") if destination else "travel_plan"
-                        today_date = datetime.now().strftime("%Y%m%d")
-                        filename = f"{destination_name}_itinerary_{today_date}.pdf"
-                        # Generate download link for PDF
-                        travel_dates = f"{start_date.strftime('%b %d, %Y')} to {end_date.strftime('%b %d, %Y')}" if 'start_date' in locals() and 'end_date' in locals() else "Your trip"
-                        download_link = get_pdf_download_link(response, filename, destination, travel_dates)
-                        # Wrap in our custom container class with download button
-                        processed_response = f"""
-                        <div class="itinerary-container">
-                            <div class="itinerary-header">
-                                🌟 Your Customized Travel Itinerary
-                            </div>
-                            <div class="itinerary-content">
-                                {processed_response}
-                                <div class="download-section">
-                                    {download_link}
-                                </div>
-                            </div>
-                        </div>
-                        """
-                        st.markdown(processed_response, unsafe_allow_html=True)
+                    # Render the Markdown response to HTML inside our custom CSS classes, once per
+                    # plan, so later reruns don't even hash the itinerary for a cache lookup
+                    if plan.html is None:
+                        plan.html = render_itinerary_html(plan.response)
+                    st.markdown(plan.html, unsafe_allow_html=True)
+                    # Build the PDF once and keep it with the plan so later reruns never lay it out
+                    # again; a plan whose PDF fails only loses its own download button
+                    if plan.pdf is None:
+                        # Imported here so sessions that never produce a plan skip loading reportlab
+                        from itinerary_pdf import build_itinerary_pdf
+                        try:
+                            plan.pdf = build_itinerary_pdf(plan.response, destination, travel_dates)
+                        except Exception as e:
+                            st.error(f"Error creating the PDF itinerary: {str(e)}")
+                    if plan.pdf is not None:
+                        # The PDF bytes only go to the browser when the button is clicked
+                        st.download_button(
+                            "Download PDF Itinerary",
+                            data=plan.pdf,
+                            file_name=filename,
+                            mime="application/pdf",
+                            key=f"download_plan_{plan_count - 1 - idx}",
+                        )
+
+# The chat tab is a fragment: a chat turn reruns just this function, leaving the travel
+# tab and the rest of the page untouched
+@st.fragment
+def chat_assistant():
+    """Render the chat history and handle a new chat turn"""
+    st.markdown('<div class="trip-header"><h2>Chat with our Travel Assistant</h2><p>Ask any travel-related questions or get recommendations</p></div>', unsafe_allow_html=True)
+    # Scrollable chat history; a new turn is added below the earlier ones as it streams
+    history = st.container(height=400)
+    # Sending a message reruns only this fragment, not the whole page
+    user_message = st.chat_input("Ask me anything about travel...", key="chat_input")
+    if user_message:
+        st.session_state.chat_messages.append({"role": "user", "content": user_message})
+    with history:
+        render_chat_history(st.session_state.chat_messages)
+    if user_message:
+        try:
+            with history:
+                chat_cache = st.session_state["_chat_cache"]
+                chat_response = get_cached_response(chat_cache, chat_agent.model.id, user_message, CHAT_SEMANTIC_THRESHOLD)
+                with st.chat_message("assistant"):
+                    if chat_response is None:
+                        # Show tokens as they arrive; the history is only updated once the stream closes
+                        chat_stream = chat_agent.run(user_message, stream=True)
+                        chat_response = st.write_stream(chunk.content for chunk in chat_stream if chunk.content)
+                        store_cached_response(chat_cache, chat_agent.model.id, user_message, chat_response)
+                    else:
+                        st.markdown(chat_response)
+            st.session_state.chat_messages.append({"role": "assistant", "content": chat_response})
+        except APITimeoutError:
+            st.error("⚠️ The travel assistant took too long to respond. Please try again.")
+        except Exception as e:
+            st.error(f"Error fetching response: {str(e)}")
 
 # Chat tab with improved styling
 with chat_tab:
     if not chat_agent:
         st.error("⚠️ GROQ API key is missing. Chat functionality is unavailable.")
     else:
-        st.markdown('<div class="trip-header"><h2>Chat with our Travel Assistant</h2><p>Ask any travel-related questions or get recommendations</p></div>', unsafe_allow_html=True)
-        # Display chat history in a card style
-        st.markdown('<div class="card" style="max-height: 400px; overflow-y: auto;">', unsafe_allow_html=True)
-        if not st.session_state.chat_messages:
-            st.markdown("""
-            <div style="text-align: center; padding: 20px; color: #888;">
-                <p>No messages yet. Start chatting below!</p>
-            </div>
-            """, unsafe_allow_html=True)
-        else:
-            for message in st.session_state.chat_messages:
-                if message["role"] == "user":
-                    st.markdown(f"""
-                    <div style="display: flex; justify-content: flex-end; margin-bottom: 10px;">
-                        <div style="padding: 10px; border-radius: 10px; max-width: 70%;">
-                            {message["content"]}
-                        </div>
-                    </div>
-                    """, unsafe_allow_html=True)
-                else:
-                    st.markdown(f"""
-                    <div style="display: flex; justify-content: flex-start; margin-bottom: 10px;">
-                        <div style="padding: 10px; border-radius: 10px; max-width: 70%;">
-                            {message["content"]}
-                        </div>
-                    </div>
-                    """, unsafe_allow_html=True)
-        st.markdown('</div>', unsafe_allow_html=True)
-        # Chat input with better styling
-        st.markdown('<div class="card" style="margin-top: 20px;">', unsafe_allow_html=True)
-        col1, col2 = st.columns([4, 1])
-        with col1:
-            user_message = st.text_input("Type your message...", key="chat_input", 
-                                        placeholder="Ask me anything about travel...")
-        with col2:
-            send_button = st.button("Send 📤", use_container_width=True)
-        if send_button and user_message:
-            with st.spinner("Thinking..."):
-                st.session_state.chat_messages.append({"role": "user", "content": user_message})
-                try:
-                    chat_response = chat_agent.run(user_message).content
-                    st.session_state.chat_messages.append({"role": "assistant", "content": chat_response})
-                    st.rerun()  # Refresh to show the new messages
-                except Exception as e:
-                    st.error(f"Error fetching response: {str(e)}")
-        st.markdown('</div>', unsafe_allow_html=True)
+        chat_assistant()
 
 # Add a footer
-st.markdown("""
-<div style="text-align: center; margin-top: 50px; padding: 20px; border-top: 1px solid #eee; color: #888;">
-    <p>Powered by AI - GlobeTrek Travel Planner © 2025</p>
-</div>
-""", unsafe_allow_html=True)
\ No newline at end of file
+st.markdown(_FOOTER_HTML, unsafe_allow_html=True)
\ No newline at end of file
@@ -0,0 +1,154 @@
+import io
+from html import unescape as html_unescape
+from xml.sax.saxutils import escape as xml_escape
+from reportlab.lib.pagesizes import A4
+from reportlab.lib import colors
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from reportlab.lib.units import inch
+import mistune
+
+def build_pdf_styles():
+    """Build the ReportLab stylesheet and custom paragraph styles for itinerary PDFs"""
+    styles = getSampleStyleSheet()
+    section_style = ParagraphStyle(
+        'SectionStyle',
+        parent=styles['Heading2'],
+        textColor=colors.blue,
+        spaceAfter=12
+    )
+    day_style = ParagraphStyle(
+        'DayStyle',
+        parent=styles['Heading3'],
+        textColor=colors.navy,
+        backColor=colors.lightgrey,
+        borderPadding=5,
+        spaceAfter=10
+    )
+    bullet_style = ParagraphStyle(
+        'BulletStyle',
+        parent=styles['Normal'],
+        leftIndent=20,
+        spaceAfter=5
+    )
+    footer_style = ParagraphStyle('Footer', alignment=1, textColor=colors.grey)
+    table_cell_style = ParagraphStyle('TableCell', parent=styles['Normal'], fontSize=9, leading=11)
+    table_style = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ])
+    return styles, section_style, day_style, bullet_style, footer_style, table_cell_style, table_style
+
+# PDF styles are constants, so build them once per process instead of on every PDF
+(_STYLES, _SECTION_STYLE, _DAY_STYLE, _BULLET_STYLE, _FOOTER_STYLE,
+ _TABLE_CELL_STYLE, _TABLE_STYLE) = build_pdf_styles()
+
+# Markdown parsed straight to mistune's token tree; the flowables are built from the tokens
+# in one pass, with no HTML rendering or DOM parsing in between
+_md = mistune.create_markdown(renderer=None, plugins=['table'])
+
+def _inline_text(tokens):
+    """Plain text of inline tokens, as ReportLab paragraph markup.
+
+    Emphasis and links keep only their text, and raw inline HTML tags are dropped.
+    """
+    parts = []
+    for token in tokens:
+        kind = token['type']
+        if kind in ('softbreak', 'linebreak'):
+            parts.append(' ')
+        elif kind in ('inline_html', 'image'):
+            continue
+        elif 'children' in token:
+            parts.append(_inline_text(token['children']))
+        else:
+            parts.append(token.get('raw', ''))
+    # mistune leaves entities as written; decode them, then escape for ReportLab's parser
+    return xml_escape(html_unescape(''.join(parts)))
+
+# One handler per block token type; each appends the token's flowables to the element list
+_HEADING_STYLES = {1: _STYLES['Heading1'], 2: _SECTION_STYLE, 3: _DAY_STYLE}
+
+def _emit_heading(elements, token):
+    style = _HEADING_STYLES.get(token['attrs']['level'])
+    if style is None:
+        return
+    elements.append(Paragraph(_inline_text(token['children']), style))
+    if style is not _DAY_STYLE:
+        elements.append(Spacer(1, 0.1*inch))
+
+def _emit_paragraph(elements, token):
+    elements.append(Paragraph(_inline_text(token['children']), _STYLES['Normal']))
+    elements.append(Spacer(1, 0.05*inch))
+
+def _emit_list(elements, token):
+    # Each item's own text becomes a bullet; nested lists follow as their own bullets
+    for item in token['children']:
+        for child in item['children']:
+            if child['type'] in ('block_text', 'paragraph'):
+                elements.append(Paragraph(f"• {_inline_text(child['children'])}", _BULLET_STYLE))
+            else:
+                _emit_blocks(elements, [child])
+
+def _emit_table(elements, token):
+    head, *body = token['children']
+    rows = [head['children']] + [row['children'] for part in body for row in part['children']]
+    # Cells are Paragraphs so long values wrap inside their column
+    table = Table(
+        [[Paragraph(_inline_text(cell['children']), _TABLE_CELL_STYLE) for cell in row] for row in rows],
+        hAlign='LEFT',
+        repeatRows=1,
+    )
+    table.setStyle(_TABLE_STYLE)
+    elements.append(table)
+    elements.append(Spacer(1, 0.1*inch))
+
+def _emit_block_quote(elements, token):
+    _emit_blocks(elements, token['children'])
+
+_TOKEN_HANDLERS = {
+    'heading': _emit_heading,
+    'paragraph': _emit_paragraph,
+    'list': _emit_list,
+    'table': _emit_table,
+    'block_quote': _emit_block_quote,
+}
+
+def _emit_blocks(elements, tokens):
+    # Block types without a handler (code blocks, raw HTML blocks, rules) are skipped
+    for token in tokens:
+        handler = _TOKEN_HANDLERS.get(token['type'])
+        if handler:
+            handler(elements, token)
+
+def build_itinerary_pdf(markdown_text, destination, travel_dates):
+    """Render an itinerary to PDF bytes"""
+    # Create a PDF in memory
+    buffer = io.BytesIO()
+    # Set up the PDF document
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    elements = []
+    # Add a header; the destination is user input, so it is escaped like the markdown text
+    elements.append(Paragraph(f"Travel Itinerary to {xml_escape(destination)}", _STYLES['Title']))
+    elements.append(Spacer(1, 0.2*inch))
+    elements.append(Paragraph(f"Travel Dates: {xml_escape(travel_dates)}", _STYLES['Heading2']))
+    elements.append(Spacer(1, 0.3*inch))
+    header_count = len(elements)
+    # Turn the markdown tokens into reportlab elements
+    _emit_blocks(elements, _md(markdown_text))
+    # If no elements were created from the markdown, add raw text as paragraphs
+    if len(elements) == header_count:
+        # Split by lines and add as paragraphs
+        for line in markdown_text.split('\n'):
+            if line.strip():
+                elements.append(Paragraph(xml_escape(line), _STYLES['Normal']))
+                elements.append(Spacer(1, 0.05*inch))
+    # Add a footer
+    elements.append(Spacer(1, 0.5*inch))
+    elements.append(Paragraph("Generated by GlobeTrek - Your AI Travel Companion", _FOOTER_STYLE))
+    # Build the PDF
+    doc.build(elements)
+    pdf_data = buffer.getvalue()
+    buffer.close()
+    return pdf_data